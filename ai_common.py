@@ -1,13 +1,10 @@
-from typing import TypeVar, Any, Optional
+from typing import TypeVar, Any, Optional, Tuple
 from dataclasses import dataclass
+from functools import lru_cache
 import logging
 import os
 from pathlib import Path
-# 配置基础日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+
 logger = logging.getLogger(__name__)
 
 T = TypeVar('T')
@@ -34,7 +31,14 @@ class ModelConfig:
     temperature: float = 0.9
     max_tokens: int = 8192
     timeout: float = 30.0
-    max_retries: int = 3
+    max_retries: int = 3  # 验证未通过时的最大对话重试次数
+    transient_retries: int = 3  # 限流、网络等瞬时错误的最大重发次数
+    retry_base: float = 1.0  # 瞬时错误重试的退避基数（秒）
+    retry_cap: float = 30.0  # 单次退避等待上限（秒）
+    retry_jitter: float = 0.5  # 退避随机抖动上限（秒）
+    stop: Optional[Tuple[str, ...]] = None  # 停止序列，生成到该标记即结束
+    json_mode: bool = False  # 服务商是否支持 response_format 的JSON模式
+    tokens_per_minute: int = 0  # 每分钟token预算，超出前主动等待以避免限流，0表示不限制
 
     def validate(self) -> None:
         """验证配置有效性"""
@@ -51,6 +55,19 @@ class ModelConfig:
             raise ConfigurationError("\n".join(errors))
 
 
+@lru_cache(maxsize=8)
+def _load_config_data(config_path: str) -> dict:
+    """解析配置文件，同一进程内按路径缓存，优先使用C扩展加载器"""
+    import yaml
+    try:
+        from yaml import CSafeLoader as Loader
+    except ImportError:
+        from yaml import SafeLoader as Loader
+
+    with open(config_path, encoding='utf-8') as f:
+        return yaml.load(f, Loader=Loader) or {}
+
+
 def load_model_config(provider: str = None, config_dir: str = None) -> ModelConfig:
     """加载指定供应商的模型配置
 
@@ -75,8 +92,7 @@ def load_model_config(provider: str = None, config_dir: str = None) -> ModelConf
         if not config_path.exists():
             raise ConfigurationError(f"配置文件不存在: {config_path}")
 
-        with open(config_path, encoding='utf-8') as f:
-            config_data = yaml.safe_load(f) or {}
+        config_data = _load_config_data(str(config_path))
 
         # 获取默认提供商
         default_provider = config_data.get('default_provider', 'aliyun')
@@ -102,6 +118,10 @@ def load_model_config(provider: str = None, config_dir: str = None) -> ModelConf
         )
         api_key = os.getenv(env_mapping.get('api_key', ''))
 
+        stop = provider_config.get('stop')
+        if isinstance(stop, str):
+            stop = [stop]
+
         # 构建配置对象
         config = ModelConfig(
             provider=selected_provider,
@@ -111,7 +131,14 @@ def load_model_config(provider: str = None, config_dir: str = None) -> ModelConf
             temperature=provider_config.get('temperature', 0.25),
             max_tokens=provider_config.get('max_tokens', 8192),
             timeout=provider_config.get('timeout', 60.0),
-            max_retries=provider_config.get('max_chat_count', 3)
+            max_retries=provider_config.get('max_chat_count', 3),
+            transient_retries=provider_config.get('transient_retries', 3),
+            retry_base=provider_config.get('retry_base', 1.0),
+            retry_cap=provider_config.get('retry_cap', 30.0),
+            retry_jitter=provider_config.get('retry_jitter', 0.5),
+            stop=tuple(stop) if stop else None,
+            json_mode=bool(provider_config.get('json_mode', False)),
+            tokens_per_minute=int(provider_config.get('tokens_per_minute', 0))
         )
 
         config.validate()
@@ -1,4 +1,5 @@
 import functools
+import random
 import time
 import logging
 from typing import Callable
@@ -18,7 +19,6 @@ def ai_processor(max_retries: int = 3, initial_delay: float = 10.0, max_delay: f
         def wrapper(*args, **kwargs):
             stream_callback = kwargs.get('stream_callback')
             last_error = None
-            current_delay = initial_delay
             
             for attempt in range(1, max_retries + 1):
                 try:
@@ -26,7 +26,7 @@ def ai_processor(max_retries: int = 3, initial_delay: float = 10.0, max_delay: f
                     result = func(*args, **kwargs)
                     elapsed = time.monotonic() - start_time
                     
-                    logger.info(f"成功处理 {func.__name__}，耗时 {elapsed:.2f}秒")
+                    logger.info("成功处理 %s，耗时 %.2f秒", func.__name__, elapsed)
                     return result
                 except Exception as e:
                     last_error = e
@@ -36,13 +36,13 @@ def ai_processor(max_retries: int = 3, initial_delay: float = 10.0, max_delay: f
                     if stream_callback:
                         stream_callback(f"\n⚠️ 第{attempt}次尝试失败（{error_type}），正在重试...\n") 
                     
-                    logger.warning(f"第{attempt}/{max_retries}次尝试失败：{str(e)}")
+                    logger.warning("第%d/%d次尝试失败：%s", attempt, max_retries, e)
                     
                     if attempt < max_retries:
-                        # 指数退避算法
-                        sleep_time = min(current_delay * (2 ** (attempt-1)), max_delay)
+                        # 指数退避算法（带随机抖动，避免并发任务同时重试）
+                        sleep_time = min(initial_delay * (2 ** (attempt - 1)), max_delay)
+                        sleep_time = random.uniform(sleep_time * 0.5, sleep_time)
                         time.sleep(sleep_time)
-                        current_delay *= 1.5
             # 所有重试失败后处理
             error_msg = f"所有{max_retries}次尝试均失败，最后错误：{str(last_error)}"
             logger.error(error_msg)
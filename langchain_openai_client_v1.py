@@ -1,11 +1,23 @@
+import asyncio
+import hashlib
+import json
 import logging
+import logging.handlers
+import multiprocessing.util
 import os
+import queue
+import random
+import uuid
+import weakref
 from typing import Callable, Tuple, Any, Dict, List, Optional, TypeVar
 import time
 import threading
+from collections import OrderedDict, deque
+from functools import lru_cache
 
-from langchain_core.callbacks import BaseCallbackHandler
+import httpx
 from langchain_openai import ChatOpenAI
+from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
 from langchain_core.messages import HumanMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.chat_history import (
@@ -16,82 +28,377 @@ from langchain_core.runnables.history import RunnableWithMessageHistory
 
 from ai_common import ModelConfig
 
-# 配置基础控制台日志
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 base_logger = logging.getLogger(__name__)
 T = TypeVar('T')
 
-class ThreadLocalChatHistoryManager:
-    """线程本地聊天历史管理类，每个线程独立实例"""
+_chat_logger: Optional[logging.Logger] = None
+_chat_logger_lock = threading.Lock()
+
+def _reset_chat_logger() -> None:
+    """fork 出的子进程不会继承父进程的 QueueListener 线程，清空继承来的logger，首次使用时重新创建"""
+    global _chat_logger, _chat_logger_lock
+    _chat_logger = None
+    _chat_logger_lock = threading.Lock()  # 父进程其它线程可能在 fork 时持有该锁
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_chat_logger)
+
+def _get_chat_logger() -> logging.Logger:
+    """获取进程内共享的对话日志logger（首次使用时创建）
+
+    整个进程只创建一个文件处理器，各线程共用，日志格式中记录线程名以区分来源。
+    调用线程只把日志记录放入队列，由后台 QueueListener 线程写文件（按小时轮转），
+    生成线程不会阻塞在磁盘写入上。每个进程（包括 fork 出的进程池子进程）各自
+    创建日志文件与监听线程。
+    """
+    global _chat_logger
+    if _chat_logger is None:
+        with _chat_logger_lock:
+            if _chat_logger is None:
+                logs_dir = os.path.join(os.path.dirname(__file__), 'logs')
+                os.makedirs(logs_dir, exist_ok=True)
+
+                timestamp = time.strftime("%Y%m%d%H%M%S", time.localtime())
+                log_file = os.path.join(logs_dir, f'chat_{os.getpid()}_{timestamp}.log')
+
+                file_handler = logging.handlers.TimedRotatingFileHandler(
+                    log_file, when='H', encoding='utf-8'
+                )
+                file_handler.setLevel(logging.DEBUG)
+                file_handler.setFormatter(logging.Formatter(
+                    '%(asctime)s - %(name)s - %(threadName)s - %(levelname)s - %(message)s'
+                ))
+
+                log_queue = queue.SimpleQueue()
+                listener = logging.handlers.QueueListener(
+                    log_queue, file_handler, respect_handler_level=True
+                )
+                listener.start()
+                # 退出时停止监听线程并写完队列中剩余日志；进程池子进程退出时不执行 atexit，
+                # multiprocessing 的退出终结器在主进程与子进程中都会执行
+                multiprocessing.util.Finalize(None, listener.stop, exitpriority=10)
+
+                logger = logging.getLogger(f'{__name__}.chat')
+                for handler in list(logger.handlers):  # fork 时继承的、指向父进程队列的处理器
+                    logger.removeHandler(handler)
+                # 默认INFO，诊断问题时设置 CHAT_LOG_LEVEL=DEBUG；级别以下的日志在入队前即被过滤
+                logger.setLevel(os.getenv('CHAT_LOG_LEVEL', 'INFO').upper())
+                logger.addHandler(logging.handlers.QueueHandler(log_queue))
+                logger.propagate = False  # 防止日志传播到根logger
+                _chat_logger = logger
+    return _chat_logger
+
+# 进程内最多保留的会话历史数，超出后淘汰最久未使用的会话（正常情况下会话在生成结束后即删除）
+MAX_SESSIONS = 256
+
+class ChatHistoryManager:
+    """聊天历史管理类，会话历史按 session_id 保存在进程级字典中，各线程与协程共享"""
     
     def __init__(self):
-        self.local = threading.local()
-        self._init_thread_logger()
-
-    def _init_thread_logger(self):
-        """初始化线程特定日志"""
-        if not hasattr(self.local, 'logger'):
-            logs_dir = os.path.join(os.path.dirname(__file__), 'logs')
-            os.makedirs(logs_dir, exist_ok=True)
-            
-            thread_id = threading.get_ident()
-            timestamp = time.strftime("%Y%m%d%H%M%S", time.localtime())
-            log_file = os.path.join(logs_dir, f'thread_{thread_id}_{timestamp}.log')
-            
-            file_handler = logging.FileHandler(log_file)
-            file_handler.setLevel(logging.DEBUG)
-            file_handler.setFormatter(logging.Formatter(
-                '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-            ))
-            
-            self.local.logger = logging.getLogger(f'{__name__}.thread_{thread_id}')
-            self.local.logger.addHandler(file_handler)
-            self.local.logger.propagate = False  # 防止日志传播到根logger
-
-    def _ensure_logger(self):
-        """确保logger已初始化"""
-        if not hasattr(self.local, 'logger'):
-            self._init_thread_logger()
+        self._store: "OrderedDict[str, InMemoryChatMessageHistory]" = OrderedDict()
+        self._lock = threading.Lock()
 
     def get_session_history(self, session_id: str) -> BaseChatMessageHistory:
-        """获取或创建线程本地会话历史"""
-        self._ensure_logger()
-        try:
-            self.local.logger.debug(f"获取会话历史 session_id={session_id}")
-            if not hasattr(self.local, 'store'):
-                self.local.logger.debug(f"初始化线程本地存储")
-                self.local.store = {}
-            
-            if session_id not in self.local.store:
-                self.local.logger.debug(f"创建新的会话历史 session_id={session_id}")
-                self.local.store[session_id] = InMemoryChatMessageHistory()
-            
-            self.local.logger.debug(f"返回会话历史 session_id={session_id}")
-            return self.local.store[session_id]
-        except Exception as e:
-            base_logger.error(f"处理会话历史时出错: {str(e)}")
-            raise
+        """获取或创建会话历史（每次调用链执行都会调用）
+
+        命中时按最近使用排序，超出上限时淘汰最久未使用的会话，避免淘汰仍在重试中的会话；
+        查找、排序与淘汰都在锁内完成，其它线程的淘汰不会在查找与排序之间删除该会话
+        """
+        with self._lock:
+            history = self._store.get(session_id)
+            if history is not None:
+                self._store.move_to_end(session_id)
+                return history
+            history = self._store[session_id] = InMemoryChatMessageHistory()
+            while len(self._store) > MAX_SESSIONS:
+                self._store.popitem(last=False)
+        _get_chat_logger().debug("创建新的会话历史 session_id=%s", session_id)
+        return history
+
+    def remove_session_history(self, session_id: str) -> None:
+        """删除会话历史（生成结束后调用，释放对话消息占用的内存）"""
+        with self._lock:
+            self._store.pop(session_id, None)
+
+    def trim_session_history(self, session_id: str) -> None:
+        """重试前裁剪会话历史，仅保留首条需求消息与最近一次AI回答
+
+        避免每轮重试都重新发送全部失败回答，使重试的输入token数保持恒定
+        """
+        with self._lock:
+            history = self._store.get(session_id)
+            if history is not None and len(history.messages) > 2:
+                history.messages = history.messages[:1] + history.messages[-1:]
+
+history_manager = ChatHistoryManager()
+
+# 系统提示词以变量传入，其内容按原文处理，无需转义大括号；模板只需构建一次
+COSMIC_PROMPT_TEMPLATE = ChatPromptTemplate.from_messages([
+    ("system", "{cosmic_prompt}"),
+    MessagesPlaceholder(variable_name="messages"),
+])
+
+# 精确匹配响应缓存（设置环境变量 COSMIC_CACHE=1 启用）
+# 以 (服务商与全部生成参数, 系统提示词, 需求内容) 为键，仅缓存通过验证的AI响应；进程内字典 + 磁盘文件两级
+RESPONSE_CACHE_ENABLED = os.getenv("COSMIC_CACHE") == "1"
+RESPONSE_CACHE_DIR = os.path.join(os.path.dirname(__file__), 'cache', 'responses')
+_response_cache: Dict[str, str] = {}
+_response_cache_lock = threading.Lock()
+
+def _response_cache_key(
+        config: ModelConfig,
+        json_mode: bool,
+        cosmic_ai_prompt: str,
+        requirement_content: str
+) -> str:
+    """计算响应缓存键：服务商、模型及影响输出的生成参数不同的配置不共用缓存"""
+    params = json.dumps([
+        config.provider,
+        config.base_url,
+        config.model_name,
+        config.temperature,
+        config.max_tokens,
+        list(config.stop) if config.stop else None,
+        json_mode,
+    ], ensure_ascii=False)
+    raw = f"{params}|{cosmic_ai_prompt}|{requirement_content}".encode('utf-8')
+    return hashlib.blake2b(raw, digest_size=32).hexdigest()
+
+def _get_cached_response(key: str) -> Optional[str]:
+    """读取缓存的AI响应，进程内未命中时回退到磁盘"""
+    with _response_cache_lock:
+        if key in _response_cache:
+            return _response_cache[key]
+
+    cache_file = os.path.join(RESPONSE_CACHE_DIR, f'{key}.txt')
+    try:
+        with open(cache_file, encoding='utf-8') as f:
+            answer = f.read()
+    except FileNotFoundError:
+        return None
+    except (OSError, UnicodeDecodeError) as e:
+        # 缓存文件损坏或无法读取时视为未命中，改为调用AI
+        base_logger.warning("读取响应缓存失败，忽略缓存 key=%s：%s", key, e)
+        return None
+    with _response_cache_lock:
+        _response_cache[key] = answer
+    return answer
+
+def _put_cached_response(key: str, answer: str) -> None:
+    """写入AI响应缓存（先写临时文件再替换，避免并发进程读到半个文件）"""
+    with _response_cache_lock:
+        _response_cache[key] = answer
+
+    cache_file = os.path.join(RESPONSE_CACHE_DIR, f'{key}.txt')
+    tmp_file = f'{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        os.makedirs(RESPONSE_CACHE_DIR, exist_ok=True)
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.write(answer)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        # 写缓存失败不影响已通过验证的结果
+        base_logger.warning("写入响应缓存失败 key=%s：%s", key, e)
+
+# 共享 HTTP 连接池的保活连接上限，覆盖并发数，保证并发请求都能复用已建立的连接；
+# 空闲连接保留60秒（httpx 默认5秒），按间隔错开发起的请求之间也能复用，省去重新握手
+HTTP_POOL_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=60.0)
+
+def _chat_key(config: ModelConfig) -> tuple:
+    """ChatOpenAI 实例缓存键：所有影响请求参数的配置项"""
+    return (
+        config.api_key,
+        config.base_url,
+        config.model_name,
+        config.temperature,
+        config.max_tokens,
+        config.stop,
+        config.tokens_per_minute > 0,
+    )
+
+def _create_chat(
+        api_key: str,
+        base_url: str,
+        model_name: str,
+        temperature: float,
+        max_tokens: int,
+        stop: Optional[Tuple[str, ...]] = None,
+        stream_usage: bool = False,
+        **client_kwargs: Any
+) -> ChatOpenAI:
+    """创建 ChatOpenAI 实例
+
+    保持流式传输以免长响应在网关处因长时间无数据而超时，
+    但不挂载逐 token 回调，完整内容直接取 response.content。
+    stream_usage 为 True 时请求最后一个流式分块携带token用量（response.usage_metadata）。
+    """
+    return ChatOpenAI(
+        openai_api_key=api_key,
+        openai_api_base=base_url,
+        model_name=model_name,
+        streaming=True,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        stop=list(stop) if stop else None,
+        stream_usage=stream_usage,
+        max_retries=0,  # 瞬时错误只由 _invoke_with_backoff 重试，避免与SDK内置重试叠加
+        **client_kwargs
+    )
+
+@lru_cache(maxsize=None)
+def _get_http_client() -> httpx.Client:
+    """进程内共享的同步 HTTP 客户端，所有 ChatOpenAI 实例共用其连接池"""
+    return httpx.Client(limits=HTTP_POOL_LIMITS)
+
+@lru_cache(maxsize=None)
+def _get_chat(chat_key: tuple) -> ChatOpenAI:
+    """按配置缓存 ChatOpenAI 实例，多次调用复用同一客户端及其 HTTP 连接池
+
+    进程内的配置只有少数几种，不设上限，避免淘汰时丢弃未关闭的 HTTP 客户端
+    """
+    return _create_chat(*chat_key, http_client=_get_http_client())
 
-history_manager = ThreadLocalChatHistoryManager()
+def _build_chain(chat: ChatOpenAI, json_mode: bool = False) -> RunnableWithMessageHistory:
+    """构建带会话历史的调用链（系统提示词作为变量在调用时传入）
+
+    json_mode 为 True 时要求模型以 JSON 对象格式输出（需服务商支持）。
+    """
+    model = chat.bind(response_format={"type": "json_object"}) if json_mode else chat
+    return RunnableWithMessageHistory(
+        COSMIC_PROMPT_TEMPLATE | model,
+        history_manager.get_session_history,
+        input_messages_key="messages",
+    )
+
+@lru_cache(maxsize=None)
+def _get_chain(chat_key: tuple, json_mode: bool) -> RunnableWithMessageHistory:
+    """按配置缓存调用链，模板与模型均不随调用变化，无需每次重新组装"""
+    return _build_chain(_get_chat(chat_key), json_mode)
+
+# 异步 HTTP 客户端与创建它的事件循环绑定，按事件循环分别缓存；
+# 事件循环结束前须调用 aclose_async_chains() 关闭客户端，释放其持有的连接
+_async_chains: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[tuple, RunnableWithMessageHistory]]" = weakref.WeakKeyDictionary()
+_async_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+def _get_async_chain(config: ModelConfig, json_mode: bool) -> RunnableWithMessageHistory:
+    """获取当前事件循环下按配置缓存的调用链（同一事件循环内共用一个异步HTTP连接池）"""
+    loop = asyncio.get_running_loop()
+    chains = _async_chains.setdefault(loop, {})
+    chat_key = _chat_key(config)
+    if (chat_key, json_mode) not in chains:
+        http_client = _async_http_clients.get(loop)
+        if http_client is None:
+            http_client = _async_http_clients[loop] = httpx.AsyncClient(limits=HTTP_POOL_LIMITS)
+        # 同时传入共享的同步客户端，否则 SDK 会为每个 ChatOpenAI 另建一个不会被关闭的默认同步客户端
+        chat = _create_chat(*chat_key, http_client=_get_http_client(), http_async_client=http_client)
+        chains[(chat_key, json_mode)] = _build_chain(chat, json_mode)
+    return chains[(chat_key, json_mode)]
+
+async def aclose_async_chains() -> None:
+    """关闭当前事件循环下创建的异步HTTP客户端并清除对应的调用链缓存，须在事件循环结束前调用"""
+    loop = asyncio.get_running_loop()
+    _async_chains.pop(loop, None)
+    http_client = _async_http_clients.pop(loop, None)
+    if http_client is not None:
+        await http_client.aclose()
+
+# 可重试的瞬时错误（限流、网络、超时、服务端5xx），按指数退避重发同一请求，不消耗验证重试次数
+TRANSIENT_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+def _backoff_delay(retry: int, config: ModelConfig) -> float:
+    """第 retry 次（从0开始）瞬时错误重试前的等待时间：指数退避 + 随机抖动，不超过上限"""
+    return min(config.retry_base * (2 ** retry) + random.uniform(0, config.retry_jitter), config.retry_cap)
+
+# token用量统计窗口（秒），与服务商的每分钟token限额对应
+TOKEN_RATE_WINDOW = 60.0
+
+class TokenRateTracker:
+    """统计最近一分钟内消耗的token数，用于在触发限流前主动等待"""
+
+    def __init__(self, window: float = TOKEN_RATE_WINDOW):
+        self.window = window
+        self._usage: "deque[Tuple[float, int]]" = deque()
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float) -> None:
+        """移除统计窗口之外的记录（调用方需持有锁）"""
+        while self._usage and now - self._usage[0][0] >= self.window:
+            self._total -= self._usage.popleft()[1]
+
+    def record(self, tokens: int) -> None:
+        """记录一次调用消耗的token数"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            self._usage.append((now, tokens))
+            self._total += tokens
+
+    def should_wait(self, budget_per_min: int) -> float:
+        """返回再次调用前需要等待的秒数，窗口内用量低于预算时返回0"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            excess = self._total - budget_per_min
+            if excess < 0:
+                return 0.0
+            # 等到最早的若干条记录移出窗口、用量回落到预算以下
+            for timestamp, tokens in self._usage:
+                excess -= tokens
+                if excess < 0:
+                    return max(self.window - (now - timestamp), 0.0)
+            return self.window
+
+# 按服务地址与模型分别统计token用量（同一服务商账号共享限额）
+_token_trackers: Dict[Tuple[str, str], TokenRateTracker] = {}
+_token_trackers_lock = threading.Lock()
+
+def _get_token_tracker(config: ModelConfig) -> TokenRateTracker:
+    """获取配置对应的token用量统计器"""
+    key = (config.base_url, config.model_name)
+    with _token_trackers_lock:
+        tracker = _token_trackers.get(key)
+        if tracker is None:
+            tracker = _token_trackers[key] = TokenRateTracker()
+        return tracker
+
+# 重试提示中校验错误信息的长度上限：超出时保留开头与结尾，减少每轮重试的提示词 token
+RETRY_ERROR_MAX_CHARS = 1500
+RETRY_ERROR_HEAD_CHARS = 1000
+RETRY_ERROR_TAIL_CHARS = 500
+
+def _truncate_error(error: str) -> str:
+    """截断过长的校验错误信息，保留开头与结尾"""
+    if len(error) <= RETRY_ERROR_MAX_CHARS:
+        return error
+    omitted = len(error) - RETRY_ERROR_HEAD_CHARS - RETRY_ERROR_TAIL_CHARS
+    return (
+        f"{error[:RETRY_ERROR_HEAD_CHARS]}\n...（省略 {omitted} 字符）...\n"
+        f"{error[-RETRY_ERROR_TAIL_CHARS:]}"
+    )
+
+# 验证失败后的重试提示模板，{error} 为截断后的校验错误信息
+RETRY_PROMPT_TEMPLATE = """\n上次生成内容未通过验证：{error}
+        \n
+## 请根据以下要求重新生成：
+
+1.  请严格遵循 **COSMIC 规范** 进行内容组织，并使用 **Markdown 语法** 进行格式化输出。
+2.  在本次生成中，请 **仅修改** 上一版本输出中未能通过校验的部分。对于已经通过校验的部分，请 **保持其内容与上一版本完全一致**，无需进行任何调整。
+3.  对于已修改的内容，**无需** 添加任何关于修改位置或修改内容的备注信息。
+
+"""
 
 class LangChainCosmicTableGenerator:
-    def __init__(self, config: ModelConfig):
-        """初始化表格生成器，验证配置有效性"""
+    def __init__(self, config: ModelConfig, json_output: bool = False):
+        """初始化表格生成器，验证配置有效性
+
+        Args:
+            config: 模型配置
+            json_output: 期望输出为JSON，服务商支持JSON模式(config.json_mode)时启用 response_format
+        """
         self._validate_config(config)
         self.config = config
-        
-        self.chat = ChatOpenAI(
-            openai_api_key=config.api_key,
-            openai_api_base=config.base_url,
-            model_name=config.model_name,
-            streaming=True,
-            callbacks=[BaseCallbackHandler()],
-            temperature=config.temperature,
-            max_tokens=config.max_tokens
-        )
+        self._json_mode = json_output and config.json_mode
 
     def _validate_config(self, config: ModelConfig):
         """验证配置参数有效性"""
@@ -102,11 +409,7 @@ class LangChainCosmicTableGenerator:
         if config.temperature < 0 or config.temperature > 2:
             raise ValueError("temperature参数需在0-2之间")
         if config.max_tokens < 100:
-            try:
-                history_manager._ensure_logger()
-                history_manager.local.logger.warning("max_tokens值(%d)可能过小", config.max_tokens)
-            except:
-                base_logger.warning("max_tokens值(%d)可能过小", config.max_tokens)
+            _get_chat_logger().warning("max_tokens值(%d)可能过小", config.max_tokens)
 
     def generate_table(
             self,
@@ -114,10 +417,10 @@ class LangChainCosmicTableGenerator:
             requirement_content: str,
             extractor: Callable[[str], T],
             validator: Callable[[T], Tuple[bool, str]],
-            max_chat_count: int = 3
+            max_chat_count: int = 3,
+            keep_history: bool = False
     ) -> Optional[T]:
         """生成并验证COSMIC表格内容
-        history_manager.local.logger.info(f"开始生成表格")
         
         Args:
             cosmic_ai_prompt: COSMIC提示模板
@@ -125,93 +428,253 @@ class LangChainCosmicTableGenerator:
             extractor: 结果提取函数
             validator: 结果验证函数
             max_chat_count: 最大重试次数
+            keep_history: 重试时保留完整对话历史，默认只保留首条需求与最近一次回答
             
         Returns:
             验证通过的结果或None
         """
-        # 转义提示词中的大括号
-        formatted_prompt = cosmic_ai_prompt.replace("{", "{{").replace("}", "}}")
-        
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", formatted_prompt),
-            MessagesPlaceholder(variable_name="messages"),
-        ])
-
-        chain = prompt | self.chat
+        cached = self._lookup_cache(cosmic_ai_prompt, requirement_content, extractor, validator)
+        if cached is not None:
+            return cached
 
-        with_message_history = RunnableWithMessageHistory(
-            chain,
-            history_manager.get_session_history,
-        )
+        chain = _get_chain(_chat_key(self.config), self._json_mode)
+        session_id, config = self._new_session()
+        prompt = requirement_content
+        try:
+            for attempt in range(max_chat_count + 1):
+                try:
+                    response = self._invoke_with_backoff(
+                        chain, self._prepare_attempt(cosmic_ai_prompt, prompt), config
+                    )
+                    is_valid, result = self._handle_answer(
+                        response.content, cosmic_ai_prompt, requirement_content, extractor, validator,
+                        attempt, max_chat_count, session_id, keep_history
+                    )
+                except Exception as e:
+                    raise self._generation_failed(e) from e
+                if is_valid:
+                    return result
+                prompt = result
 
-        session_id = f"thread_{threading.get_ident()}"
-        config = {"configurable": {"session_id": session_id}}
+            return None
+        finally:
+            history_manager.remove_session_history(session_id)
 
-        self.chat.callbacks = [self._create_stream_callback()]
+    async def agenerate_table(
+            self,
+            cosmic_ai_prompt: str,
+            requirement_content: str,
+            extractor: Callable[[str], T],
+            validator: Callable[[T], Tuple[bool, str]],
+            max_chat_count: int = 3,
+            keep_history: bool = False
+    ) -> Optional[T]:
+        """异步生成并验证COSMIC表格内容，参数与返回值同 generate_table"""
+        cached = self._lookup_cache(cosmic_ai_prompt, requirement_content, extractor, validator)
+        if cached is not None:
+            return cached
 
-        for attempt in range(max_chat_count + 1):
-            try:
+        chain = _get_async_chain(self.config, self._json_mode)
+        session_id, config = self._new_session()
+        prompt = requirement_content
+        try:
+            for attempt in range(max_chat_count + 1):
                 try:
-                    history_manager._ensure_logger()
-                    history_manager.local.logger.debug("开始调用AI")
-                except:
-                    base_logger.debug("开始调用AI")
-                response = with_message_history.invoke(
-                    [HumanMessage(content=requirement_content)],
-                    config=config,
-                )
-                history_manager.local.logger.info("收到AI响应 (长度: %d 字符)", len(response.content))
-                history_manager.local.logger.info("收到AI响应内容 \n%s", response.content)
-
-                full_answer = response.content
-                history_manager.local.logger.debug(f"提取数据 content_length={len(full_answer)}")
-                extracted_data = extractor(full_answer)
-                history_manager.local.logger.info(f"开始验证数据")
-                is_valid, error = validator(extracted_data)
- 
+                    response = await self._ainvoke_with_backoff(
+                        chain, self._prepare_attempt(cosmic_ai_prompt, prompt), config
+                    )
+                    is_valid, result = self._handle_answer(
+                        response.content, cosmic_ai_prompt, requirement_content, extractor, validator,
+                        attempt, max_chat_count, session_id, keep_history
+                    )
+                except Exception as e:
+                    raise self._generation_failed(e) from e
                 if is_valid:
-                    history_manager.local.logger.info(f"本轮AI生成内容校验通过")
-                    return extracted_data
-                    
-                if attempt == max_chat_count:
-                    history_manager.local.logger.error("历史对话次数已达最大次数(%d)", max_chat_count)
-                    raise ValueError(f"验证失败：{error}")
-
-                requirement_content = self._build_retry_prompt(error)
-                history_manager.local.logger.info(f"构建重试提示")
-                history_manager.local.logger.info(requirement_content)
-                history_manager.local.logger.info(f"第{attempt+1}次重试，更新请求内容")
-
-            except Exception as e:
-                history_manager.local.logger.error("生成过程中发生异常：%s", str(e))
-                raise RuntimeError("COSMIC表格生成失败") from e
+                    return result
+                prompt = result
+
+            return None
+        finally:
+            history_manager.remove_session_history(session_id)
+
+    def _new_session(self) -> Tuple[str, Dict[str, Any]]:
+        """创建本次生成的独立会话，返回 (session_id, 调用链配置)"""
+        session_id = f"session_{uuid.uuid4().hex}"
+        return session_id, {"configurable": {"session_id": session_id}}
+
+    def _prepare_attempt(self, cosmic_ai_prompt: str, prompt: str) -> Dict[str, Any]:
+        """构建单轮调用的输入（系统提示词 + 本轮需求或重试提示）"""
+        _get_chat_logger().debug("开始调用AI")
+        return {
+            "cosmic_prompt": cosmic_ai_prompt,
+            "messages": [HumanMessage(content=prompt)],
+        }
+
+    def _handle_answer(
+            self,
+            full_answer: str,
+            cosmic_ai_prompt: str,
+            requirement_content: str,
+            extractor: Callable[[str], T],
+            validator: Callable[[T], Tuple[bool, str]],
+            attempt: int,
+            max_chat_count: int,
+            session_id: str,
+            keep_history: bool
+    ) -> Tuple[bool, Any]:
+        """验证单轮响应：通过时写入缓存，未通过时按需裁剪会话历史
+
+        Returns:
+            (True, 提取结果) 或 (False, 下一轮重试提示)
+        """
+        is_valid, result = self._handle_response(full_answer, extractor, validator, attempt, max_chat_count)
+        if is_valid:
+            self._store_cache(cosmic_ai_prompt, requirement_content, full_answer)
+        elif not keep_history:
+            history_manager.trim_session_history(session_id)
+        return is_valid, result
+
+    def _generation_failed(self, error: Exception) -> RuntimeError:
+        """记录生成异常并返回统一的失败异常"""
+        _get_chat_logger().error("生成过程中发生异常：%s", str(error))
+        return RuntimeError("COSMIC表格生成失败")
+
+    def _invoke_with_backoff(self, chain: RunnableWithMessageHistory, inputs: Dict[str, Any], config: Dict[str, Any]):
+        """调用AI，遇到瞬时错误按指数退避重试（失败的请求不会写入会话历史）"""
+        for retry in range(self.config.transient_retries + 1):
+            time.sleep(self._token_budget_delay())
+            try:
+                return self._record_usage(chain.invoke(inputs, config=config))
+            except TRANSIENT_ERRORS as e:
+                time.sleep(self._transient_retry_delay(retry, e))
+
+    async def _ainvoke_with_backoff(self, chain: RunnableWithMessageHistory, inputs: Dict[str, Any], config: Dict[str, Any]):
+        """_invoke_with_backoff 的异步版本"""
+        for retry in range(self.config.transient_retries + 1):
+            await asyncio.sleep(self._token_budget_delay())
+            try:
+                return self._record_usage(await chain.ainvoke(inputs, config=config))
+            except TRANSIENT_ERRORS as e:
+                await asyncio.sleep(self._transient_retry_delay(retry, e))
+
+    def _transient_retry_delay(self, retry: int, error: Exception) -> float:
+        """第 retry 次（从0开始）瞬时错误后的退避等待秒数，重试次数用尽时重新抛出该错误"""
+        if retry == self.config.transient_retries:
+            raise error
+        delay = _backoff_delay(retry, self.config)
+        _get_chat_logger().warning(
+            "AI调用瞬时错误(%s)，%.1f秒后第%d次重试：%s", type(error).__name__, delay, retry + 1, error
+        )
+        return delay
+
+    def _token_budget_delay(self) -> float:
+        """配置了每分钟token预算时，返回发起下一次调用前需要等待的秒数"""
+        if self.config.tokens_per_minute <= 0:
+            return 0.0
+        delay = _get_token_tracker(self.config).should_wait(self.config.tokens_per_minute)
+        if delay > 0:
+            _get_chat_logger().info("最近一分钟token用量已达预算，等待%.1f秒", delay)
+        return delay
+
+    def _record_usage(self, response):
+        """记录流式响应最后一个分块返回的token用量"""
+        usage = getattr(response, "usage_metadata", None)
+        if usage:
+            _get_chat_logger().info(
+                "token用量 输入=%d 输出=%d", usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+            )
+            if self.config.tokens_per_minute > 0:
+                _get_token_tracker(self.config).record(usage.get("total_tokens", 0))
+        return response
+
+    def _lookup_cache(
+            self,
+            cosmic_ai_prompt: str,
+            requirement_content: str,
+            extractor: Callable[[str], T],
+            validator: Callable[[T], Tuple[bool, str]]
+    ) -> Optional[T]:
+        """查询精确匹配响应缓存
+
+        Returns:
+            命中且仍通过验证的提取结果，未命中返回 None
+        """
+        if RESPONSE_CACHE_ENABLED:
+            cache_key = _response_cache_key(self.config, self._json_mode, cosmic_ai_prompt, requirement_content)
+            extracted_data = self._revalidate_cached(
+                _get_cached_response(cache_key), extractor, validator
+            )
+            if extracted_data is not None:
+                base_logger.info("命中响应缓存 key=%s", cache_key)
+                return extracted_data
 
         return None
 
-    def _create_stream_callback(self) -> BaseCallbackHandler:
-        """创建流式回调处理器"""
-        class StreamCallback(BaseCallbackHandler):
-            def __init__(self):
-                self.token_count = 0
+    def _store_cache(self, cosmic_ai_prompt: str, requirement_content: str, full_answer: str) -> None:
+        """缓存通过验证的AI响应"""
+        if RESPONSE_CACHE_ENABLED:
+            cache_key = _response_cache_key(self.config, self._json_mode, cosmic_ai_prompt, requirement_content)
+            _put_cached_response(cache_key, full_answer)
 
-            def on_llm_new_token(self, token: str, **kwargs) -> None:
-                if self.token_count % 500 == 0:
-                    history_manager.local.logger.debug(f'已处理{self.token_count}个token')
-                self.token_count += 1
+    def _revalidate_cached(
+            self,
+            cached_answer: Optional[str],
+            extractor: Callable[[str], T],
+            validator: Callable[[T], Tuple[bool, str]]
+    ) -> Optional[T]:
+        """校验规则可能已调整，缓存命中后重新提取并验证，不通过则视为未命中"""
+        if cached_answer is None:
+            return None
+        try:
+            extracted_data = extractor(cached_answer)
+            is_valid, _ = validator(extracted_data)
+        except Exception as e:
+            base_logger.warning("缓存响应提取失败，忽略缓存：%s", e)
+            return None
+        return extracted_data if is_valid else None
 
-        return StreamCallback()
+    def _handle_response(
+            self,
+            full_answer: str,
+            extractor: Callable[[str], T],
+            validator: Callable[[T], Tuple[bool, str]],
+            attempt: int,
+            max_chat_count: int
+    ) -> Tuple[bool, Any]:
+        """提取并验证AI响应
 
-    def _build_retry_prompt(self, error: str) -> str:
-        """构建重试提示模板"""
-        return f"""\n上次生成内容未通过验证：{error}
-        \n
-## 请根据以下要求重新生成：
+        Returns:
+            (True, 提取结果) 或 (False, 下一轮重试提示)
 
-1.  请严格遵循 **COSMIC 规范** 进行内容组织，并使用 **Markdown 语法** 进行格式化输出。
-2.  在本次生成中，请 **仅修改** 上一版本输出中未能通过校验的部分。对于已经通过校验的部分，请 **保持其内容与上一版本完全一致**，无需进行任何调整。
-3.  对于已修改的内容，**无需** 添加任何关于修改位置或修改内容的备注信息。
+        Raises:
+            ValueError: 已达最大重试次数仍未通过验证
+        """
+        chat_logger = _get_chat_logger()
+        chat_logger.info("收到AI响应 (长度: %d 字符)", len(full_answer))
+        chat_logger.info("收到AI响应内容 \n%s", full_answer)
 
-"""
+        chat_logger.debug("提取数据 content_length=%d", len(full_answer))
+        extracted_data = extractor(full_answer)
+        chat_logger.info("开始验证数据")
+        is_valid, error = validator(extracted_data)
+
+        if is_valid:
+            chat_logger.info("本轮AI生成内容校验通过")
+            return True, extracted_data
+
+        if attempt == max_chat_count:
+            chat_logger.error("历史对话次数已达最大次数(%d)", max_chat_count)
+            raise ValueError(f"验证失败：{error}")
+
+        retry_prompt = self._build_retry_prompt(error)
+        chat_logger.info("构建重试提示")
+        chat_logger.info(retry_prompt)
+        chat_logger.info("第%d次重试，更新请求内容", attempt + 1)
+        return False, retry_prompt
+
+    def _build_retry_prompt(self, error: str) -> str:
+        """构建重试提示"""
+        return RETRY_PROMPT_TEMPLATE.format_map({"error": _truncate_error(error)})
 
 def call_ai(
         ai_prompt: str,
@@ -219,7 +682,8 @@ def call_ai(
         extractor: Callable[[str], Any],
         validator: Callable[[Any], Tuple[bool, str]],
         config: ModelConfig,
-        max_chat_count: int = 5
+        max_chat_count: int = 5,
+        json_output: bool = False
 ) -> str:
     """调用AI生成表格的统一入口
     
@@ -230,11 +694,12 @@ def call_ai(
         validator: 结果验证函数
         config: 模型配置
         max_chat_count: 最大重试次数
+        json_output: 期望输出为JSON（服务商支持时启用JSON模式）
         
     Returns:
         经过验证的最终结果
     """
-    generator = LangChainCosmicTableGenerator(config=config)
+    generator = LangChainCosmicTableGenerator(config=config, json_output=json_output)
     return generator.generate_table(
         ai_prompt,
         requirement_content,
@@ -242,3 +707,149 @@ def call_ai(
         validator,
         max_chat_count
     )
+
+async def acall_ai(
+        ai_prompt: str,
+        requirement_content: str,
+        extractor: Callable[[str], Any],
+        validator: Callable[[Any], Tuple[bool, str]],
+        config: ModelConfig,
+        max_chat_count: int = 5,
+        json_output: bool = False
+) -> str:
+    """call_ai 的异步版本，可配合 asyncio.gather 并发调用多个需求
+
+    参数与返回值同 call_ai。
+    """
+    generator = LangChainCosmicTableGenerator(config=config, json_output=json_output)
+    return await generator.agenerate_table(
+        ai_prompt,
+        requirement_content,
+        extractor,
+        validator,
+        max_chat_count
+    )
+
+# Batch 接口相关配置
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_POLL_INTERVAL = 30.0  # 批量任务状态轮询间隔（秒）
+BATCH_MAX_WAIT = 2 * 3600.0  # 批量任务最长等待时间（秒），超时后取消任务，由调用方改为逐个调用
+BATCH_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+def call_ai_batch(
+        ai_prompt: str,
+        requirement_contents: List[str],
+        extractor: Callable[[str], Any],
+        validator: Callable[[Any], Tuple[bool, str]],
+        config: ModelConfig,
+        poll_interval: float = BATCH_POLL_INTERVAL,
+        json_output: bool = False,
+        max_wait: float = BATCH_MAX_WAIT
+) -> List[Optional[Any]]:
+    """通过服务商的 Batch 接口一次提交多个相互独立的需求
+
+    适用于吞吐优先的离线场景（费用更低，但结果最长可能在24小时后返回）。
+    Batch 接口无法进行多轮对话，验证未通过或请求失败的需求对应位置返回 None，
+    由调用方改用 call_ai 单独重试。
+
+    Args:
+        ai_prompt: AI系统提示语
+        requirement_contents: 需求内容文本列表
+        extractor: 结果提取函数
+        validator: 结果验证函数
+        config: 模型配置
+        poll_interval: 任务状态轮询间隔（秒）
+        json_output: 期望输出为JSON（服务商支持时启用JSON模式）
+        max_wait: 最长等待时间（秒），超时后取消批量任务
+
+    Returns:
+        与 requirement_contents 一一对应的验证结果列表
+
+    Raises:
+        RuntimeError: 批量任务失败、过期、被取消或等待超时
+    """
+    from openai import OpenAI
+
+    with OpenAI(api_key=config.api_key, base_url=config.base_url) as client:
+        extra_body: Dict[str, Any] = {}
+        if config.stop:
+            extra_body["stop"] = list(config.stop)
+        if json_output and config.json_mode:
+            extra_body["response_format"] = {"type": "json_object"}
+
+        lines = []
+        for idx, requirement_content in enumerate(requirement_contents):
+            lines.append(json.dumps({
+                "custom_id": str(idx),
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": {
+                    "model": config.model_name,
+                    "messages": [
+                        {"role": "system", "content": ai_prompt},
+                        {"role": "user", "content": requirement_content},
+                    ],
+                    "temperature": config.temperature,
+                    "max_tokens": config.max_tokens,
+                    **extra_body,
+                },
+            }, ensure_ascii=False))
+
+        batch_file = client.files.create(
+            file=("batch_input.jsonl", "\n".join(lines).encode("utf-8")),
+            purpose="batch"
+        )
+        batch = client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window="24h"
+        )
+        base_logger.info("已提交批量任务 batch_id=%s，共 %d 个需求", batch.id, len(requirement_contents))
+
+        deadline = time.monotonic() + max_wait
+        while batch.status not in BATCH_TERMINAL_STATUSES:
+            if time.monotonic() >= deadline:
+                client.batches.cancel(batch.id)
+                raise RuntimeError(f"批量任务等待超时（{max_wait:.0f}秒），已取消 batch_id={batch.id}")
+            time.sleep(poll_interval)
+            batch = client.batches.retrieve(batch.id)
+            base_logger.debug("批量任务 batch_id=%s 状态: %s", batch.id, batch.status)
+
+        if batch.status != "completed":
+            raise RuntimeError(f"批量任务未完成 batch_id={batch.id} status={batch.status}")
+
+        results: List[Optional[Any]] = [None] * len(requirement_contents)
+        if not batch.output_file_id:
+            base_logger.error("批量任务 batch_id=%s 无输出文件", batch.id)
+            return results
+
+        output = client.files.content(batch.output_file_id).text
+
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+            idx = int(item["custom_id"])
+        except (ValueError, KeyError, TypeError) as e:
+            base_logger.warning("批量任务输出行无法解析，已跳过: %s", e)
+            continue
+        response = item.get("response") or {}
+        if response.get("status_code") != 200:
+            base_logger.warning("批量任务第 %d 个需求请求失败: %s", idx, item.get("error"))
+            continue
+
+        try:
+            full_answer = response["body"]["choices"][0]["message"]["content"]
+            extracted_data = extractor(full_answer)
+            is_valid, error = validator(extracted_data)
+        except Exception as e:
+            base_logger.warning("批量任务第 %d 个需求结果提取失败: %s", idx, e)
+            continue
+
+        if is_valid:
+            results[idx] = extracted_data
+        else:
+            base_logger.warning("批量任务第 %d 个需求验证未通过: %s", idx, error)
+
+    return results
@@ -1,5 +1,6 @@
 from datetime import datetime
-from functools import partial
+from functools import lru_cache, partial
+import os
 import re
 import json
 import shutil
@@ -7,11 +8,12 @@ from pathlib import Path
 import logging
 import argparse
 from dataclasses import dataclass
-import queue
+import asyncio
 import time
+from typing import List, Optional, Tuple
 
 from ai_common import load_model_config
-from langchain_openai_client_v1 import call_ai
+from langchain_openai_client_v1 import call_ai, acall_ai, call_ai_batch, aclose_async_chains
 
 from read_file_content import (
     read_file_content,
@@ -25,10 +27,14 @@ from validate_cosmic_table import (
     validate_trigger_event_json
 )
 
-# 配置日志
+# 配置日志（全局唯一的日志配置入口，其余模块只获取各自的 logger）
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('app.log', encoding='utf-8'),
+        logging.StreamHandler()
+    ]
 )
 logger = logging.getLogger(__name__)
 
@@ -56,7 +62,7 @@ def load_prompt_template(template_path: Path) -> str:
     try:
         return read_file_content(str(template_path))
     except Exception as e:
-        logger.error(f"Failed to load prompt template: {template_path}")
+        logger.error("Failed to load prompt template: %s", template_path)
         raise RuntimeError(f"Prompt template loading failed: {e}") from e
 
 
@@ -66,6 +72,7 @@ def main() -> None:
     命令行参数:
         --stage1   仅执行阶段1（生成触发事件JSON）
         --stage2   仅执行阶段2（生成COSMIC表格）
+        --batch-api 阶段2先通过服务商Batch接口批量生成（费用更低、耗时更长），失败的事件再逐个调用
         默认同时执行两个阶段
     """
     try:
@@ -73,6 +80,7 @@ def main() -> None:
         parser = argparse.ArgumentParser()
         parser.add_argument('--stage1', action='store_true', help='仅执行阶段1（生成触发事件JSON）')
         parser.add_argument('--stage2', action='store_true', help='仅执行阶段2（生成COSMIC表格）')
+        parser.add_argument('--batch-api', action='store_true', help='阶段2先通过Batch接口批量生成，失败的事件再逐个调用')
         args = parser.parse_args()
 
         config = ProjectPaths()
@@ -82,33 +90,37 @@ def main() -> None:
         if not txt_files:
             raise FileNotFoundError(f"需求目录中未找到.txt文件: {config.requirements}")
 
-        # 使用多进程处理所有需求文件
-        from multiprocessing import Process
-        processes = []
-        
-        for request_file in txt_files:
-            logger.info(f"开始处理需求文件: {request_file}")
-            requirement_content = read_file_content(str(request_file))
-            
-            # 创建新进程处理每个文件
-            p = Process(target=process_single_requirement, 
-                        args=(args, config, request_file, requirement_content))
-            p.start()
-            processes.append(p)
-            time.sleep(3)
-            
-        # 等待所有进程完成
-        for p in processes:
-            p.join()
+        # 使用进程池处理所有需求文件，进程数上限为CPU核数-1，避免Excel/Word保存时争抢CPU和磁盘
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        max_workers = max(1, min(len(txt_files), (os.cpu_count() or 2) - 1))
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}
+            for request_file in txt_files:
+                logger.info("开始处理需求文件: %s", request_file)
+
+                # 需求内容由子进程自行读取，主进程不持有全部文件内容
+                future = executor.submit(process_single_requirement, args, config, request_file)
+                futures[future] = request_file
+                time.sleep(3)
+
+            # 等待所有进程完成
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error("需求文件处理失败 %s: %s", futures[future].name, e)
         
         return  # 主进程提前返回
     except Exception as e:
-        logger.error(f"主进程执行失败: {str(e)}")
+        logger.error("主进程执行失败: %s", e)
         raise
 
-def process_single_requirement(args, config, request_file, requirement_content):
+def process_single_requirement(args, config, request_file):
     """处理单个需求文件的进程函数"""
     try:
+        requirement_content = read_file_content(str(request_file))
+
         # 提取表格行数要求
         total_rows = extract_content_from_requst(requirement_content)
         if total_rows is None:
@@ -119,7 +131,7 @@ def process_single_requirement(args, config, request_file, requirement_content):
         if request_name is None:
             raise ValueError(f"需求文件中缺少需求名称: {request_file.name}")
 
-        logger.info(f"正在处理需求文件: {request_file.name}")
+        logger.info("正在处理需求文件: %s", request_file.name)
 
         json_str = ""
         output_path = config.output / request_file.stem
@@ -129,12 +141,12 @@ def process_single_requirement(args, config, request_file, requirement_content):
         run_stage2 = args.stage2 or not args.stage1
 
         # 检查阶段1输出文件是否已存在
-        base_name = request_file.name.split(".")[0]
-        json_file = output_path / f"{base_name}.json"
-        xlsx_file = output_path / f"{base_name}.xlsx"
+        # 与 save_content_to_file 的命名规则保持一致（仅去掉最后一个扩展名）
+        json_file = output_path / f"{request_file.stem}.json"
+        xlsx_file = output_path / f"{request_file.stem}.xlsx"
 
         if run_stage1 and json_file.exists():
-            logger.info(f"触发事件JSON文件已存在，跳过阶段1: {json_file}")
+            logger.info("触发事件JSON文件已存在，跳过阶段1: %s", json_file)
             json_str = read_file_content(str(json_file))
         elif run_stage1:
             # 阶段1：生成触发事件JSON
@@ -152,11 +164,24 @@ def process_single_requirement(args, config, request_file, requirement_content):
             json_str = read_file_content(str(json_file))
 
         if run_stage2 and xlsx_file.exists():
-            logger.info(f"Excel表格文件已存在，跳过阶段2: {xlsx_file}")
+            logger.info("Excel表格文件已存在，跳过阶段2: %s", xlsx_file)
         elif run_stage2:
+            cosmic_prompt = load_prompt_template(config.cosmic_table_template)
+            if args.batch_api:
+                # Batch 接口只提交一次，不放在带整体重试的 generate_cosmic_table 中，
+                # 未生成的事件由其逐个调用流程补充（逐个调用失败时才整体重试）
+                generate_event_tables_by_batch(
+                    expand_trigger_events(json_str),
+                    request_file,
+                    event_temp_dir(config.output, request_file),
+                    requirement_content,
+                    cosmic_prompt,
+                    request_name
+                )
+
             # 阶段2：生成COSMIC表格
             generate_cosmic_table(
-                prompt=load_prompt_template(config.cosmic_table_template),
+                prompt=cosmic_prompt,
                 base_content=requirement_content,
                 json_data=json_str,
                 output_dir=config.output,
@@ -165,13 +190,13 @@ def process_single_requirement(args, config, request_file, requirement_content):
             )
 
     except (FileNotFoundError, ValueError) as e:
-        logger.error(f"初始化失败: {str(e)}")
+        logger.error("初始化失败: %s", e)
         raise
     except json.JSONDecodeError as e:
-        logger.error(f"JSON解析失败: {str(e)}")
+        logger.error("JSON解析失败: %s", e)
         raise
     except Exception as e:
-        logger.error(f"未处理的异常: {str(e)}")
+        logger.error("未处理的异常: %s", e)
         raise RuntimeError("程序执行异常") from e
 
 
@@ -197,7 +222,8 @@ def generate_trigger_events(
         extractor=extract_json_from_text,
         validator=validator,
         max_chat_count=5,
-        config=load_model_config()
+        config=load_model_config(),
+        json_output=True
     )
 
     output_path = output_dir / request_file.stem
@@ -208,7 +234,7 @@ def generate_trigger_events(
         content_type="json"
     )
 
-    logger.info(f"触发事件已保存至: {output_path}")
+    logger.info("触发事件已保存至: %s", output_path)
     return json_data
 
 
@@ -229,7 +255,6 @@ def generate_cosmic_table(
         json_data: 触发事件JSON数据（字符串格式）
         output_dir: 输出目录
         request_file: 原始需求文件路径
-        batch_size: 每批处理事件数（默认5）
         
     执行逻辑:
         1. 检查输入JSON数据有效性
@@ -241,60 +266,21 @@ def generate_cosmic_table(
     logger.info("开始生成COSMIC表格...")
 
     try:
-        # 解析原始JSON数据
-        cosmic_data = json.loads(json_data)
-        # 创建临时目录 (使用需求文件名作为目录名)
-        temp_dir = output_dir / f"temp_{request_file.stem}"
-        temp_dir.mkdir(exist_ok=True)
-
-        # 结果队列
-        result_queue = queue.Queue()
-        from concurrent.futures import ThreadPoolExecutor, as_completed
-
-        event_idx = 0
-        # 使用线程池管理并发
-        with ThreadPoolExecutor(max_workers=8) as executor:
-            futures = []
-            
-            # 遍历每个需求
-            for req in cosmic_data["functional_user_requirements"]:
-                requirement_name = req["requirement"]
-                req_events = req["trigger_events"]
-
-                # 处理每个触发事件
-                for idx, event in enumerate(req_events):
-                    # 提交任务到线程池
-                    future = executor.submit(
-                        process_single_event,
-                        event,
-                        requirement_name,
-                        request_file,
-                        temp_dir,
-                        base_content,
-                        prompt,
-                        request_name,
-                        result_queue,
-                        event_idx
-                    )
-                    futures.append(future)
-                    event_idx += 1
-                    time.sleep(10)  # 添加10秒延迟
-
-            # 等待所有任务完成
-            for future in as_completed(futures):
-                try:
-                    future.result()
-                except Exception as e:
-                    logger.error(f"线程执行出错: {str(e)}")
-
-        # 移除原有的5秒延迟
-
-        # 收集结果
-        temp_files = []
-        while not result_queue.empty():
-            temp_files.append(result_queue.get())
-
-        if event_idx != len(temp_files):
+        all_events = expand_trigger_events(json_data)
+        temp_dir = event_temp_dir(output_dir, request_file)
+
+        # 所有事件在同一事件循环中并发调用AI，结果按事件序号排列（已生成的事件直接复用）
+        results = asyncio.run(generate_event_tables(
+            all_events,
+            request_file,
+            temp_dir,
+            base_content,
+            prompt,
+            request_name
+        ))
+        temp_files = [path for path in results if path is not None]
+
+        if len(all_events) != len(temp_files):
             raise ValueError("部分COSMIC表格生成失败！")
         # 合并临时文件
         full_table = merge_temp_files(temp_files)
@@ -334,14 +320,205 @@ def generate_cosmic_table(
 
         # 清理临时文件
         shutil.rmtree(temp_dir)
-        logger.info(f"COSMIC表格已保存至: {output_path}")
+        logger.info("COSMIC表格已保存至: %s", output_path)
 
     except Exception as e:
-        logger.error(f"COSMIC表格生成失败: {str(e)}")
+        logger.error("COSMIC表格生成失败: %s", e)
         raise
 
 
-def process_single_event(
+def expand_trigger_events(json_data: str) -> list:
+    """解析触发事件JSON，展开所有需求下的触发事件为 (需求名称, 触发事件) 列表，列表下标即事件序号"""
+    cosmic_data = json.loads(json_data)
+    return [
+        (req["requirement"], event)
+        for req in cosmic_data["functional_user_requirements"]
+        for event in req["trigger_events"]
+    ]
+
+
+def event_temp_dir(output_dir: Path, request_file: Path) -> Path:
+    """创建并返回存放各触发事件临时表格的目录（使用需求文件名作为目录名）"""
+    temp_dir = output_dir / f"temp_{request_file.stem}"
+    temp_dir.mkdir(exist_ok=True)
+    return temp_dir
+
+
+def event_temp_filename(request_file: Path, event_idx: int) -> str:
+    """单个触发事件的COSMIC表格临时文件名"""
+    return f"{request_file.stem}_event{event_idx}.md"
+
+
+# 需求内容中表格行数要求所在行的标记及其中需替换的行数
+ROW_REQUIREMENT_MARKER = "表格总行数要求："
+ROW_REQUIREMENT_REGEX = re.compile(r"(\d+)(行左右)")
+
+
+@lru_cache(maxsize=8)
+def split_base_content(base_content: str) -> Tuple[str, Optional[str], str]:
+    """按最后一个行数要求行拆分需求内容，同一需求的所有事件只拆分一次
+
+    Returns:
+        (行数要求行之前的内容, 行数要求行, 之后的内容)，三者拼接即为按行规范化后的需求内容；
+        未找到行数要求时返回 (全部内容, None, "")
+    """
+    content_lines = base_content.splitlines()
+    for i in range(len(content_lines) - 1, -1, -1):
+        if ROW_REQUIREMENT_MARKER in content_lines[i]:
+            prefix = "".join(line + "\n" for line in content_lines[:i])
+            suffix = "".join("\n" + line for line in content_lines[i + 1:])
+            return prefix, content_lines[i], suffix
+    return "\n".join(content_lines), None, ""
+
+
+def build_event_content(event, requirement_name, base_content) -> str:
+    """构建单个触发事件的AI请求内容（需求背景 + 该事件的功能过程列表）"""
+    # 构建单个触发事件的JSON
+    event_json = {
+        "functional_user_requirements": [{
+            "requirement": requirement_name,
+            "trigger_events": [event]
+        }]
+    }
+
+    # 计算本事件的功能过程数量
+    total_processes = sum(
+        len(e["functional_processes"])
+        for req in event_json["functional_user_requirements"]
+        for e in req["trigger_events"]
+    )
+
+    # 生成动态行数范围
+    min_rows = total_processes * 3
+    row_range = min_rows
+
+    # 更新基础内容中的行数要求（只替换行数要求所在的一行）
+    prefix, row_line, suffix = split_base_content(base_content)
+    if row_line is None:
+        updated_content = prefix
+    else:
+        updated_content = prefix + ROW_REQUIREMENT_REGEX.sub(
+            f"{row_range}行（根据功能过程数量动态计算）", row_line
+        ) + suffix
+
+    # 生成分批内容
+    return f"{updated_content}\n结合需求背景、详细方案设计按照以下触发事件与功能过程列表生成符合规范的cosmic表格：\n{json.dumps(event_json, ensure_ascii=False, indent=2)}"
+
+
+def generate_event_tables_by_batch(
+        all_events: list,
+        request_file: Path,
+        temp_dir: Path,
+        base_content: str,
+        prompt: str,
+        request_name: str
+) -> None:
+    """通过服务商Batch接口一次提交所有未生成的触发事件
+
+    验证通过的结果直接写入临时文件；请求失败或验证未通过的事件不写文件，
+    由后续的逐个调用流程补充生成（可多轮对话修正）。
+    """
+    pending = [
+        (event_idx, requirement_name, event)
+        for event_idx, (requirement_name, event) in enumerate(all_events)
+        if not (temp_dir / event_temp_filename(request_file, event_idx)).exists()
+    ]
+    if not pending:
+        return
+
+    try:
+        results = call_ai_batch(
+            ai_prompt=prompt,
+            requirement_contents=[
+                build_event_content(event, requirement_name, base_content)
+                for _, requirement_name, event in pending
+            ],
+            extractor=extract_table_from_text,
+            validator=partial(validate_cosmic_table, request_name=request_name),
+            config=load_model_config()
+        )
+    except Exception as e:
+        logger.error("批量接口调用失败，全部改为逐个调用: %s", e)
+        return
+
+    generated = 0
+    for (event_idx, _, _), markdown_table in zip(pending, results):
+        if markdown_table is None:
+            continue
+        save_content_to_file(
+            file_name=event_temp_filename(request_file, event_idx),
+            output_dir=str(temp_dir),
+            content=markdown_table,
+            content_type="markdown"
+        )
+        generated += 1
+
+    logger.info("批量接口生成触发事件 %d/%d 个，其余改为逐个调用", generated, len(pending))
+
+
+# 同时进行中的AI调用数上限
+MAX_CONCURRENT_EVENTS = 8
+# 相邻两个事件发起请求的间隔（秒），错开请求避免瞬间触发服务商限流
+EVENT_SUBMIT_INTERVAL = 10
+
+
+async def generate_event_tables(
+        all_events: list,
+        request_file: Path,
+        temp_dir: Path,
+        base_content: str,
+        prompt: str,
+        request_name: str
+) -> List[Optional[Path]]:
+    """并发生成所有触发事件的COSMIC表格临时文件
+
+    返回与 all_events 一一对应的临时文件路径列表，生成失败的事件为 None
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_EVENTS)
+    model_config = load_model_config()
+
+    async def run_event(event_idx, requirement_name, event, start_delay):
+        await asyncio.sleep(start_delay)
+        async with semaphore:
+            return await process_single_event(
+                event,
+                requirement_name,
+                request_file,
+                temp_dir,
+                base_content,
+                prompt,
+                request_name,
+                model_config,
+                event_idx
+            )
+
+    async def reuse_existing(temp_path):
+        return temp_path
+
+    tasks = []
+    skipped_count = 0
+    for event_idx, (requirement_name, event) in enumerate(all_events):
+        # 已生成的临时文件直接复用，不再调用AI，也不占用请求间隔
+        temp_path = temp_dir / event_temp_filename(request_file, event_idx)
+        if temp_path.exists():
+            tasks.append(reuse_existing(temp_path))
+            skipped_count += 1
+            continue
+
+        start_delay = (len(tasks) - skipped_count) * EVENT_SUBMIT_INTERVAL
+        tasks.append(run_event(event_idx, requirement_name, event, start_delay))
+
+    if skipped_count:
+        logger.info("跳过已生成的触发事件 %d 个", skipped_count)
+
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        # 每次 asyncio.run 都是新的事件循环，结束前关闭本循环创建的HTTP客户端
+        await aclose_async_chains()
+
+
+async def process_single_event(
         event,
         requirement_name,
         request_file,
@@ -349,63 +526,24 @@ def process_single_event(
         base_content,
         prompt,
         request_name,
-        result_queue,
+        model_config,
         event_idx: int = 0
-):
-    """处理单个触发事件的线程函数"""
+) -> Optional[Path]:
+    """处理单个触发事件的协程，返回生成的临时文件路径，失败时返回 None"""
     try:
-        temp_filename = f"{request_file.stem}_event{event_idx}.md"
+        temp_filename = event_temp_filename(request_file, event_idx)
         temp_path = temp_dir / temp_filename
 
-        # 检查文件是否已存在
-        if temp_path.exists():
-            print(f"文件 {temp_filename} 已存在，跳过处理")
-            result_queue.put(temp_path)
-            return
-
-        # 构建单个触发事件的JSON
-        event_json = {
-            "functional_user_requirements": [{
-                "requirement": requirement_name,
-                "trigger_events": [event]
-            }]
-        }
-
-        # 计算本事件的功能过程数量
-        total_processes = sum(
-            len(e["functional_processes"])
-            for req in event_json["functional_user_requirements"]
-            for e in req["trigger_events"]
-        )
-
-        # 生成动态行数范围
-        min_rows = total_processes * 3
-        row_range = min_rows
-
-        # 更新基础内容中的行数要求
-        content_lines = base_content.splitlines()
-        for i in reversed(range(len(content_lines))):
-            if "表格总行数要求：" in content_lines[i]:
-                content_lines[i] = re.sub(
-                    r"(\d+)(行左右)",
-                    f"{row_range}行（根据功能过程数量动态计算）",
-                    content_lines[i]
-                )
-                break
-
-        updated_content = '\n'.join(content_lines)
-
-        # 生成分批内容
-        combined_content = f"{updated_content}\n结合需求背景、详细方案设计按照以下触发事件与功能过程列表生成符合规范的cosmic表格：\n{json.dumps(event_json, ensure_ascii=False, indent=2)}"
+        combined_content = build_event_content(event, requirement_name, base_content)
 
         # 调用AI生成表格
         validator = partial(validate_cosmic_table, request_name=request_name)
-        markdown_table = call_ai(
+        markdown_table = await acall_ai(
             ai_prompt=prompt,
             requirement_content=combined_content,
             extractor=extract_table_from_text,
             validator=validator,
-            config=load_model_config()
+            config=model_config
         )
 
         # 保存临时文件
@@ -416,10 +554,11 @@ def process_single_event(
             content_type="markdown"
         )
 
-        result_queue.put(temp_path)
+        return temp_path
 
     except Exception as e:
-        logger.error(f"处理事件失败: {str(e)}")
+        logger.error("处理事件失败: %s", e)
+        return None
 
 
 if __name__ == "__main__":
@@ -4,28 +4,21 @@ import re
 import logging
 from pathlib import Path
 from typing import Optional, Union, List
-import docx
 # 第三方库导入
-import pandas as pd
+# pandas、win32com 仅在生成Excel / 读取.doc时使用，在对应函数内按需导入
 from docx import Document
 from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
 from docx.shared import Pt, RGBColor
 from openpyxl import load_workbook
+from openpyxl.cell.cell import MergedCell
 from openpyxl.styles import Alignment
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.merge import MergedCellRange
 import subprocess
-import win32com.client as win32
 
 # 文件操作
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('app.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+logger = logging.getLogger(__name__)
 
 def read_file_content(file_path: Union[str, Path]) -> Optional[str]:
     """读取文件内容并返回去除首尾空格的字符串
@@ -67,6 +60,20 @@ DEFAULT_FONT_STYLES = {
     "body": {"name": "宋体", "size": Pt(10.5)}
 }
 
+# Markdown表格单元格分隔符（忽略转义的 \|），模块加载时预编译，逐行解析时直接复用
+MARKDOWN_CELL_SPLIT_RE = re.compile(r'(?<!\\)\|')
+MARKDOWN_CELL_STRIP_SPLIT_RE = re.compile(r'\s*\|\s*')
+
+# 纯文本类内容类型对应的输出文件扩展名
+TEXT_CONTENT_EXTENSIONS = {
+    "json": ".json",
+    "text": ".txt",
+    "markdown": ".md"
+}
+
+# 合并单元格统一使用的对齐样式（共享同一实例，避免每次合并重复创建）
+MERGED_CELL_ALIGNMENT = Alignment(horizontal="center", vertical="center", wrap_text=True)
+
 def save_content_to_file(
     file_name: str, 
     output_dir: Union[str, Path],
@@ -91,27 +98,21 @@ def save_content_to_file(
         os.makedirs(output_dir, exist_ok=True)
 
         # 4. 根据 content_type 确定文件扩展名和保存逻辑
-        if content_type == "json":
-            output_filename = os.path.join(output_dir, f"{base_name}.json")
-            with open(output_filename, "w", encoding="utf-8") as f:
-                f.write(content)
-        elif content_type == "text":
-            output_filename = os.path.join(output_dir, f"{base_name}.txt")
-            with open(output_filename, "w", encoding="utf-8") as f:
-                f.write(content)
-
-        elif content_type == "markdown":
-            output_filename = os.path.join(output_dir, f"{base_name}.md")
+        text_extension = TEXT_CONTENT_EXTENSIONS.get(content_type)
+        if text_extension is not None:
+            output_filename = os.path.join(output_dir, f"{base_name}{text_extension}")
             with open(output_filename, "w", encoding="utf-8") as f:
                 f.write(content)
         elif content_type == 'xlsx':
+            import pandas as pd
+
             output_filename = os.path.join(output_dir, f"{base_name}.xlsx")
             df = markdown_table_to_df(content)
             if df is not None:
-                df.to_excel(output_filename, index=False)  # 保存为 Excel
-
-            # 合并表格单元格
-            merge_cells_by_column(output_filename, "Sheet1")
+                # 写入数据后直接在内存中的工作表上合并单元格，只保存一次，无需重新打开文件
+                with pd.ExcelWriter(output_filename, engine="openpyxl") as writer:
+                    df.to_excel(writer, index=False)  # 保存为 Excel
+                    merge_sheet_cells_by_column(writer.sheets["Sheet1"])
         elif content_type == 'docx':
             ##先读取excel 文件
             excel_file = os.path.join(output_dir, f"{base_name}.xlsx")
@@ -124,10 +125,10 @@ def save_content_to_file(
             with open(output_filename, "w", encoding="utf-8") as f:
                 f.write(content)
 
-        logging.info(f"已创建文件: {output_filename}")
+        logger.info("已创建文件: %s", output_filename)
 
     except Exception as e:
-        logging.error(f"处理文件 {file_name} 时发生错误", exc_info=True)
+        logger.error("处理文件 %s 时发生错误", file_name, exc_info=True)
 
 
 def extract_content_from_requst(text, extract_type: str = "total_rows"):
@@ -138,10 +139,15 @@ def extract_content_from_requst(text, extract_type: str = "total_rows"):
       Returns:
         提取到的数字 (整数)，如果没有找到，则返回 None。
       """
+    # 文本中不含关键字时直接返回，无需执行正则
     if extract_type == 'total_rows' :
+        if "表格总行数要求：" not in text:
+            return None
         match = re.search(r"表格总行数要求：(\d+)", text)  #
-        return int(match.group(1))
+        return int(match.group(1)) if match else None
     if extract_type == 'request_name':
+        if "客户需求：" not in text:
+            return None
         match = re.search(r"客户需求：(.*)", text)  # 需求名称
         return match.group(1)
     else:
@@ -149,6 +155,8 @@ def extract_content_from_requst(text, extract_type: str = "total_rows"):
 
 
 def markdown_table_to_df(table_text):
+    import pandas as pd
+
     # 分割行
     lines = table_text.strip().split('\n')
 
@@ -157,17 +165,17 @@ def markdown_table_to_df(table_text):
     separator_line = lines[1]
 
     # 获取表头单元格数量（基于分隔符行）
-    header_cols = [s.strip() for s in re.split(r'(?<!\\)\|', separator_line)[1:-1]]
+    header_cols = [s.strip() for s in MARKDOWN_CELL_SPLIT_RE.split(separator_line)[1:-1]]
     num_cols = len(header_cols)
 
     # 解析表头行，并根据分隔符行的数量进行调整
-    header = [h.strip() for h in re.split(r'(?<!\\)\|', header_line)[1:-1]]
+    header = [h.strip() for h in MARKDOWN_CELL_SPLIT_RE.split(header_line)[1:-1]]
     header = (header + [''] * (num_cols - len(header)))[:num_cols]  # 补齐或截断
 
     # --- 数据行处理 ---
     data = []
     for line in lines[2:]:
-        row = [cell.strip() for cell in re.split(r'(?<!\\)\|', line)[1:-1]]
+        row = [cell.strip() for cell in MARKDOWN_CELL_SPLIT_RE.split(line)[1:-1]]
         row = (row + [''] * (num_cols - len(row)))  # 补齐
         row = [cell.replace("<br>", "\n") for cell in row]
         data.append(row)
@@ -192,7 +200,7 @@ def process_markdown_table(markdown_table_string, num_cols_to_process=5):
     header = lines[0:2]
     data_rows = lines[2:]
 
-    table_data = [re.split(r'\s*\|\s*', row.strip('|')) for row in data_rows]
+    table_data = [MARKDOWN_CELL_STRIP_SPLIT_RE.split(row.strip('|')) for row in data_rows]
 
     num_cols = len(table_data[0])
 
@@ -219,7 +227,7 @@ def apply_font_style(run, style_name: str) -> None:
     """应用预定义的字体样式
     
     Args:
-        run: docx的Run对象
+        run: docx的Run对象（或具有 font 属性的样式对象）
         style_name: 样式名称（heading1/heading2/body）
     """
     style = DEFAULT_FONT_STYLES[style_name]
@@ -238,11 +246,15 @@ def create_function_design_doc(excel_file: Union[str, Path], docx_file: Union[st
         docx_file:  生成的Word文档的路径。
     """
 
-    workbook = load_workbook(filename=excel_file)
+    # 只读取单元格取值：read_only 流式解析，不构建样式与单元格对象
+    workbook = load_workbook(filename=excel_file, read_only=True, data_only=True, keep_links=False)
     sheet = workbook.active
 
     document = Document()
 
+    # 正文字体统一设置在 Normal 样式上，正文段落无需逐个 run 重复设置
+    apply_font_style(document.styles["Normal"], "body")
+
     # 第4章 系统功能设计 (固定内容)
     heading = document.add_heading("第4章 系统功能设计", level=1)
     heading.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
@@ -269,12 +281,10 @@ def create_function_design_doc(excel_file: Union[str, Path], docx_file: Union[st
             current_process_num = 1  # 重置流程计数器
 
         if process:
-            paragraph = document.add_paragraph(f"（{current_process_num}）{process}")
-            run = paragraph.runs[0]
-            run.font.name = '宋体'
-            run.font.size = Pt(10.5)
+            document.add_paragraph(f"（{current_process_num}）{process}")
             current_process_num += 1
 
+    workbook.close()  # read_only 模式需显式关闭以释放文件句柄
     document.save(docx_file)
 
 
@@ -287,38 +297,37 @@ def merge_cells_by_column(filename, sheetname):
         sheetname: 要处理的 Sheet 名称。
     """
     workbook = load_workbook(filename)
-    sheet = workbook[sheetname]
+    merge_sheet_cells_by_column(workbook[sheetname])
+    workbook.save(filename)  # 保存修改
+
 
-    # 处理 A 到 E 列 (0-4)
-    for col_index in range(5):  # 列索引从0开始
+def merge_sheet_cells_by_column(sheet) -> None:
+    """
+    按列合并已加载工作表中 A 到 E 列连续相同内容的单元格（不负责保存）。
+
+    Args:
+        sheet: openpyxl 的 Worksheet 对象。
+    """
+    # 先扫描 A 到 E 列 (0-4) 收集全部待合并区域，再统一提交合并
+    # 按列一次性读取取值，避免逐个单元格调用 sheet.cell()
+    pending_merges = []  # (起始行, 结束行, 列号)
+    columns = sheet.iter_cols(min_col=1, max_col=5, min_row=2, values_only=True)
+    for col_index, column_values in enumerate(columns):  # 列索引从0开始
+        column = col_index + 1
         start_row = None
         start_value = None
         end_row = None  # 新增：记录批次的结束行
 
         # 循环每一行，从第二行开始（跳过标题行）
-        for row_index in range(2, sheet.max_row + 1):
-            cell = sheet.cell(row=row_index, column=col_index + 1)
-            cell_value = cell.value
-
+        for row_index, cell_value in enumerate(column_values, start=2):
             if cell_value is not None and cell_value != "":  # 非空单元格
                 if start_row is None:  # 找到第一个非空单元格
                     start_row = row_index
                     start_value = cell_value
                     end_row = row_index  # 初始时，结束行就是起始行
                 elif cell_value != start_value:  # 遇到不同内容的非空单元格
-                    # 合并单元格 (如果 end_row 有效)
-                    if end_row is not None:
-                        sheet.merge_cells(
-                            start_row=start_row,
-                            start_column=col_index + 1,
-                            end_row=end_row,  # 使用 end_row
-                            end_column=col_index + 1,
-                        )
-                        merged_cell = sheet.cell(row=start_row, column=col_index + 1)
-                        merged_cell.alignment = Alignment(
-                            horizontal="center", vertical="center", wrap_text=True
-                        )
-                        merged_cell.value = start_value
+                    # 记录上一批待合并区域
+                    pending_merges.append((start_row, end_row, column))
 
                     # 重置起始位置和结束位置
                     start_row = row_index
@@ -330,21 +339,24 @@ def merge_cells_by_column(filename, sheetname):
             elif start_row is not None:  # 遇到空单元格，且已经有起始位置
                 end_row = row_index      # 更新结束行
 
-        # 处理最后一批单元格（如果存在）
-        if start_row is not None and end_row is not None:
-            sheet.merge_cells(
-                start_row=start_row,
-                start_column=col_index + 1,
-                end_row=end_row,  # 使用 end_row
-                end_column=col_index + 1,
-            )
-            merged_cell = sheet.cell(row=start_row, column=col_index + 1)
-            merged_cell.alignment = Alignment(
-                horizontal="center", vertical="center", wrap_text=True
-            )
-            merged_cell.value = start_value
-
-    workbook.save(filename)  # 保存修改
+        # 记录最后一批单元格（如果存在）
+        if start_row is not None:
+            pending_merges.append((start_row, end_row, column))
+
+    # 统一提交所有合并区域（合并后左上角单元格保留原值，只需设置对齐样式）
+    # 各区域按列、按行连续段生成，天然互不重叠，因此直接加入合并集合，
+    # 跳过 sheet.merge_cells() 每次对已有区域的重叠扫描（整体 O(K²)）；
+    # 其余步骤与 merge_cells() 一致：区域内除左上角外的单元格替换为 MergedCell（值为 None）
+    # 单个单元格的区域无需合并，只保留对齐样式
+    for start_row, end_row, column in pending_merges:
+        if end_row > start_row:
+            column_letter = get_column_letter(column)
+            merged_range = MergedCellRange(sheet, f"{column_letter}{start_row}:{column_letter}{end_row}")
+            sheet.merged_cells.ranges.add(merged_range)
+            for row in range(start_row + 1, end_row + 1):
+                sheet._cells[row, column] = MergedCell(sheet, row, column)
+            merged_range.format()
+        sheet.cell(row=start_row, column=column).alignment = MERGED_CELL_ALIGNMENT
 
 
 def merge_temp_files(temp_files: List[Path]) -> str:
@@ -381,6 +393,8 @@ def read_word_document(file_path: str) -> str:
     """
 
     def read_doc_file(path):
+        import win32com.client as win32
+
         word = win32.gencache.EnsureDispatch('Word.Application')
         doc = word.Documents.Open(path)
         content = doc.Content.Text
@@ -0,0 +1,50 @@
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell.cell import MergedCell
+
+from read_file_content import merge_sheet_cells_by_column, save_content_to_file
+
+HEADER = ["客户需求", "功能用户", "功能用户需求", "触发事件", "功能过程", "子过程描述"]
+ROWS = [
+    ["R", "U", "需求A", "E1", "P1", "s1"],
+    ["R", "U", "需求A", "E1", "P1", "s2"],
+    ["R", "U", "需求A", "E1", "P2", "s3"],
+    ["R", "U", "需求B", "E2", "P3", "s4"],
+    ["R", "U", "需求B", "E2", "P3", "s5"],
+]
+
+
+def _build_sheet():
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(HEADER)
+    for row in ROWS:
+        sheet.append(row)
+    return workbook, sheet
+
+
+def test_merge_hides_non_anchor_cells():
+    _, sheet = _build_sheet()
+    merge_sheet_cells_by_column(sheet)
+
+    assert sorted(str(r) for r in sheet.merged_cells.ranges) == sorted(
+        ["A2:A6", "B2:B6", "C2:C4", "C5:C6", "D2:D4", "D5:D6", "E2:E3", "E5:E6"]
+    )
+    # 合并区域内除左上角外的单元格与 merge_cells() 一致，为值为 None 的 MergedCell
+    assert isinstance(sheet["A3"], MergedCell)
+    assert [sheet.cell(row=3, column=c).value for c in range(1, 7)] == [None, None, None, None, None, "s2"]
+    assert sheet["E4"].value == "P2"  # 单个单元格不合并，保留原值
+
+
+def test_merged_xlsx_reads_back_hidden_cells_as_none(tmp_path):
+    lines = ["| " + " | ".join(HEADER) + " |", "|" + "---|" * len(HEADER)]
+    lines += ["| " + " | ".join(row) + " |" for row in ROWS]
+    save_content_to_file("table.txt", tmp_path, "\n".join(lines), content_type="xlsx")
+
+    # 与 create_function_design_doc 一致以只读方式读取：只读模式不会清理合并区域，读到的是文件中实际写入的值
+    workbook = load_workbook(tmp_path / "table.xlsx", read_only=True)
+    sheet = workbook.active
+    rows = list(sheet.iter_rows(min_row=2, values_only=True))
+    assert rows[0] == tuple(ROWS[0])
+    assert rows[1] == (None, None, None, None, None, "s2")
+    assert rows[3] == (None, None, "需求B", "E2", "P3", "s4")
+    workbook.close()
@@ -1,5 +1,6 @@
 import re
 import json
+from functools import lru_cache
 
 import markdown
 from typing import List, Dict, Tuple, Set, Optional, Any, Union
@@ -11,6 +12,39 @@ from typing import List, Dict, Tuple, Set
 from typing import Tuple
 # 假设 markdown_table_to_list 函数已经定义
 
+# --- COSMIC表格校验常量（模块加载时构建一次，每次校验直接复用） ---
+EXPECTED_HEADERS = ["客户需求", "功能用户", "功能用户需求", "触发事件", "功能过程",
+                    "子过程描述", "数据移动类型", "数据组", "数据属性", "复用度", "CFP", "ΣCFP"]
+
+FORBIDDEN_KEYWORDS_PROCESS = {
+    "加载", "解析", "初始化", "点击按钮", "页面", "渲染", "保存", "输入",
+    "读取", "获取", "输出", "切换", "计算", "重置", "分页", "排序",
+    "适配", "开发", "部署", "迁移", "安装", "存储", "缓存", "校验",
+    "验证", "是否", "判断"
+}
+
+FORBIDDEN_KEYWORDS_SUBPROCESS = {
+    "校验", "验证", "检查", "判断", "组装报文", "构建报文", "日志保存",
+    "写日志", "加载", "解析", "初始化", "点击按钮", "页面", "渲染",
+    "保存", "输入", "读取", "获取", "输出", "切换", "计算", "重置",
+    "分页", "排序", "适配", "开发", "部署", "迁移", "安装", "存储",
+    "缓存", "调用XX接口" # 假设 "调用XX接口" 是一个通用模式
+}
+
+VALID_DATA_MOVE_TYPES = {"E", "X", "R", "W"}
+# 逐行校验使用的正则在模块加载时预编译一次
+FUNCTIONAL_USER_REGEX = re.compile(r"^发起者:\s*.*?\s*接收者：\s*.*$")
+DATA_ATTRIBUTE_REGEX = re.compile(r"^[\u4e00-\u9fa5\s,，]+$")
+DATA_ATTRIBUTE_INVALID_CHAR_REGEX = re.compile(r"[\u4e00-\u9fa5\s,，]")
+DATA_ATTRIBUTE_SPLIT_REGEX = re.compile(r"[,，]\s*")
+
+
+@lru_cache(maxsize=1024)
+def is_valid_functional_user(func_user_cell: str) -> bool:
+    """校验'功能用户'格式。同一表格中该列取值高度重复，按取值缓存校验结果。"""
+    return FUNCTIONAL_USER_REGEX.match(func_user_cell) is not None
+
+
 def validate_cosmic_table(markdown_table_str: str, request_name: str) -> Tuple[bool, str]:
     """
     校验COSMIC功能点度量表格。
@@ -25,30 +59,6 @@ def validate_cosmic_table(markdown_table_str: str, request_name: str) -> Tuple[b
            第二个元素是错误信息字符串（如果校验不通过, 多个错误用换行符分隔）。
     """
 
-    # --- 常量定义 ---
-    EXPECTED_HEADERS = ["客户需求", "功能用户", "功能用户需求", "触发事件", "功能过程",
-                        "子过程描述", "数据移动类型", "数据组", "数据属性", "复用度", "CFP", "ΣCFP"]
-
-    FORBIDDEN_KEYWORDS_PROCESS = {
-        "加载", "解析", "初始化", "点击按钮", "页面", "渲染", "保存", "输入",
-        "读取", "获取", "输出", "切换", "计算", "重置", "分页", "排序",
-        "适配", "开发", "部署", "迁移", "安装", "存储", "缓存", "校验",
-        "验证", "是否", "判断"
-    }
-
-    FORBIDDEN_KEYWORDS_SUBPROCESS = {
-        "校验", "验证", "检查", "判断", "组装报文", "构建报文", "日志保存",
-        "写日志", "加载", "解析", "初始化", "点击按钮", "页面", "渲染",
-        "保存", "输入", "读取", "获取", "输出", "切换", "计算", "重置",
-        "分页", "排序", "适配", "开发", "部署", "迁移", "安装", "存储",
-        "缓存", "调用XX接口" # 假设 "调用XX接口" 是一个通用模式
-    }
-
-    VALID_DATA_MOVE_TYPES = {"E", "X", "R", "W"}
-    FUNCTIONAL_USER_REGEX = r"^发起者:\s*.*?\s*接收者：\s*.*$"
-    DATA_ATTRIBUTE_REGEX = r"^[\u4e00-\u9fa5\s,，]+$"
-    DATA_ATTRIBUTE_SPLIT_REGEX = r"[,，]\s*"
-
     # --- 主校验逻辑 ---
     errors: List[str] = []
     table_data: List[Dict[str, str]] = [] # 初始化为空列表
@@ -131,7 +141,7 @@ def validate_cosmic_table(markdown_table_str: str, request_name: str) -> Tuple[b
         # 规则 4 & 输入校验: 功能用户
         if not func_user_cell:
             errors.append(f"数据行 {data_row_num} (文件行 {file_row_num}): '功能用户' 不能为空。")
-        elif not re.match(FUNCTIONAL_USER_REGEX, func_user_cell):
+        elif not is_valid_functional_user(func_user_cell):
             errors.append(f"数据行 {data_row_num} (文件行 {file_row_num}): '功能用户' ({func_user_cell}) 格式错误，应为 '发起者: [系统] 接收者：[系统]'。")
 
         # 规则 6 & 输入校验: 触发事件
@@ -170,12 +180,12 @@ def validate_cosmic_table(markdown_table_str: str, request_name: str) -> Tuple[b
         if not data_attributes_str_cell:
             errors.append(f"数据行 {data_row_num} (文件行 {file_row_num}): '数据属性' 不能为空。")
         else:
-            if not re.fullmatch(DATA_ATTRIBUTE_REGEX, data_attributes_str_cell):
+            if not DATA_ATTRIBUTE_REGEX.fullmatch(data_attributes_str_cell):
                 # 提取无效字符用于提示
-                invalid_chars = "".join(sorted(list(set(re.sub(r'[\u4e00-\u9fa5\s,，]', '', data_attributes_str_cell)))))
+                invalid_chars = "".join(sorted(list(set(DATA_ATTRIBUTE_INVALID_CHAR_REGEX.sub('', data_attributes_str_cell)))))
                 errors.append(f"数据行 {data_row_num} (文件行 {file_row_num}): '数据属性' ({data_attributes_str_cell}) 包含非中文、逗号或空格的字符 (例如: '{invalid_chars}')。")
             else:
-                attributes = [attr.strip() for attr in re.split(DATA_ATTRIBUTE_SPLIT_REGEX, data_attributes_str_cell) if attr.strip()]
+                attributes = [attr.strip() for attr in DATA_ATTRIBUTE_SPLIT_REGEX.split(data_attributes_str_cell) if attr.strip()]
                 if not (3 <= len(attributes) <= 15):
                     errors.append(f"数据行 {data_row_num} (文件行 {file_row_num}): '数据属性' 数量为 {len(attributes)}，应在 3 到 15 个之间。属性列表: {attributes}")
 
@@ -356,6 +366,9 @@ def extract_table_from_text(text: str) -> str:
     返回值:
     str: 提取出的Markdown表格字符串，如果未找到表格则返回空字符串。
     """
+    # 快速路径：不含管道符的文本不可能包含表格，无需进行正则匹配
+    if '|' not in text:
+        return ''
 
     # 更精确的 Markdown 表格正则表达式:
     # - `(?:^|\n)`: 匹配字符串开头或换行符，确保表格在新行开始。
@@ -422,6 +435,43 @@ def validate_all_done(current_answer_content):
     else:
         return 0  # 最后一轮回复
 
+# --- 触发事件JSON校验常量（模块加载时构建一次，每次校验直接复用） ---
+# 功能用户需求(FUR)规则
+FUR_MAX_LEN = 40
+FUR_MIN_TE = 1
+FUR_MAX_TE = 8
+
+# 触发事件(TE)规则
+TE_MIN_FP = 1
+TE_MAX_FP = 6
+
+# 功能过程(FP)规则
+# 严格禁止的关键字
+FP_FORBIDDEN_KEYWORDS_ERROR = ["校验", "验证", "判断", "是否", "日志", "组装", "构建"]
+# 建议避免的关键字 (技术/实现细节, 来自规则4, 经验8)
+FP_FORBIDDEN_KEYWORDS_WARN = [
+    "加载", "解析", "初始化", "点击", "按钮", "页面", "渲染",
+    "保存",  # 除非指持久化存储 W
+    "输入",  # 除非指数据入口 E
+    "读取",  # 除非指数据读取 R
+    "获取",  # 倾向于使用更具体的 R/E
+    "输出",  # 除非指数据出口 X
+    "切换", "计算", "重置", "分页", "排序", "适配",
+    "开发", "部署", "迁移", "安装",
+    "存储",  # 除非指持久化存储 W
+    "缓存", "接口"  # 避免前后端重复计数 (经验5)
+]
+# 合并用于检查：关键字 -> 级别，错误级别覆盖同名的警告级别
+ALL_FORBIDDEN_KEYWORDS = {
+    **{keyword: "警告" for keyword in FP_FORBIDDEN_KEYWORDS_WARN},
+    **{keyword: "错误" for keyword in FP_FORBIDDEN_KEYWORDS_ERROR},
+}
+
+# 功能过程(FP)总数估算相关 (基于平均子过程数 2.5 )
+FP_TOTAL_COUNT_FACTOR_MIN = 3.0
+FP_TOTAL_COUNT_FACTOR_MAX = 2.0
+
+
 def validate_trigger_event_json(json_str: str, total_rows: int) -> Tuple[bool, str]:
 
     """
@@ -436,41 +486,8 @@ def validate_trigger_event_json(json_str: str, total_rows: int) -> Tuple[bool, s
             - bool: 校验是否通过 (True/False)。
             - str: 错误/警告信息列表（换行符分隔），如果通过则为空字符串。
     """
-    # 功能用户需求(FUR)规则
-    FUR_MAX_LEN = 40
-    FUR_MIN_TE = 1
-    FUR_MAX_TE = 8
-
-    # 触发事件(TE)规则
-    TE_MIN_FP = 1
-    TE_MAX_FP = 6
-
-    # 功能过程(FP)规则
-    # 严格禁止的关键字
-    FP_FORBIDDEN_KEYWORDS_ERROR = ["校验", "验证", "判断", "是否", "日志", "组装", "构建"]
-    # 建议避免的关键字 (技术/实现细节, 来自规则4, 经验8)
-    FP_FORBIDDEN_KEYWORDS_WARN = [
-        "加载", "解析", "初始化", "点击", "按钮", "页面", "渲染",
-        "保存",  # 除非指持久化存储 W
-        "输入",  # 除非指数据入口 E
-        "读取",  # 除非指数据读取 R
-        "获取",  # 倾向于使用更具体的 R/E
-        "输出",  # 除非指数据出口 X
-        "切换", "计算", "重置", "分页", "排序", "适配",
-        "开发", "部署", "迁移", "安装",
-        "存储",  # 除非指持久化存储 W
-        "缓存", "接口"  # 避免前后端重复计数 (经验5)
-    ]
-    # 合并用于检查
-    ALL_FORBIDDEN_KEYWORDS = set(FP_FORBIDDEN_KEYWORDS_ERROR+FP_FORBIDDEN_KEYWORDS_WARN)
-
-    # 功能过程(FP)总数估算相关 (基于平均子过程数 2.5 )
-    FP_TOTAL_COUNT_FACTOR_MIN = 3.0
-    FP_TOTAL_COUNT_FACTOR_MAX = 2.0
-
-
     errors: List[str] = []
-    all_functional_processes: List[str] = [] # 用于全局功能过程重名检查
+    all_functional_processes: Set[str] = set() # 用于全局功能过程重名检查
 
 
     # --- 1. JSON 解析 ---
@@ -565,9 +582,8 @@ def validate_trigger_event_json(json_str: str, total_rows: int) -> Tuple[bool, s
 
                 # 规则4 & 经验8：禁止的关键字检查
                 found_forbidden = []
-                for keyword in ALL_FORBIDDEN_KEYWORDS:
+                for keyword, level in ALL_FORBIDDEN_KEYWORDS.items():
                     if keyword in process:
-                        level = "错误" if keyword in FP_FORBIDDEN_KEYWORDS_ERROR else "警告"
                         found_forbidden.append(f"{level}: 功能过程 '{process}' ({process_path}) 包含禁用/不推荐关键字 '{keyword}'")
                 if found_forbidden:
                     errors.extend(found_forbidden)
@@ -576,7 +592,7 @@ def validate_trigger_event_json(json_str: str, total_rows: int) -> Tuple[bool, s
                 if process in all_functional_processes:
                     errors.append(f"重复性校验错误: 功能过程 '{process}' ({process_path}) 与之前的功能过程重复。")
                 else:
-                    all_functional_processes.append(process)
+                    all_functional_processes.add(process)
 
     # --- 4. 总体数量校验 ---
     if total_event_count == 0 and not any("functional_user_requirements" in e for e in errors): # 只有在FUR列表本身有效时才报此错